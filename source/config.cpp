@@ -20,15 +20,20 @@ namespace stdfs = std::filesystem;
 
 namespace wg
 {
-	static std::string read_key(const std::string& key)
+	static std::string read_key(const std::string& key, const stdfs::path& base_dir)
 	{
 		if(not zst::str_view(key).starts_with("file:"))
 			return key;
 
-		// skip 'file:'
-		auto f = open(key.c_str() + 5, O_RDONLY);
-		if(f < 0)
+		// skip 'file:'; relative paths are relative to the directory containing the config file
+		auto key_path = base_dir / (key.c_str() + 5);
+		auto f = open(key_path.c_str(), O_RDONLY);
+		if(f < 0 && errno == ENOENT)
 			msg::error_and_exit("Key file '{}' does not exist", key);
+		else if(f < 0)
+			msg::error_and_exit("Could not open key file '{}': {} ({})", key, strerror(errno), errno);
+
+		auto close_file = util::defer([f]() { close(f); });
 
 		std::string ret {};
 		ret.resize(512);
@@ -40,7 +45,6 @@ namespace wg
 			msg::error_and_exit("Empty key file");
 
 		ret.resize(static_cast<size_t>(did_read));
-		close(f);
 
 		while(not ret.empty() && (ret.back() == '\n' || ret.back() == '\r'))
 			ret.pop_back();
@@ -48,23 +52,19 @@ namespace wg
 		return ret;
 	}
 
-	Config Config::load(const std::string& filename)
+	static Config parse_config(const std::string& filename, std::string_view contents)
 	{
-		if(not stdfs::exists(filename))
-			msg::error_and_exit("Could not read config file {}", filename);
-
-		auto maybe_cfg = toml::parse_file(filename);
+		auto maybe_cfg = toml::parse(contents, filename);
 		if(not maybe_cfg)
 			msg::error_and_exit("Failed to parse config: {}", maybe_cfg.error().description());
 
 		auto file_path = stdfs::path(filename);
 		file_path.replace_extension("");
 
-		auto path = stdfs::weakly_canonical(stdfs::path(filename) / "..");
-
-		// chdir to it so file: loads are relative to the config file
+		// relative file: keys and the post-up/post-down hooks are relative to the config file
 		std::error_code ec {};
-		if(stdfs::current_path(path, ec); ec)
+		auto base_dir = stdfs::weakly_canonical(stdfs::path(filename), ec).parent_path();
+		if(ec)
 			msg::error_and_exit("Failed to get directory of config file: {}", ec.message());
 
 		auto& cfg = maybe_cfg.table();
@@ -76,8 +76,9 @@ namespace wg
 			msg::error_and_exit("Missing required table [interface]");
 
 		auto& interface = *table["interface"].as_table();
-		if(not interface.contains("private-key"))
-			msg::error_and_exit("Missing required key 'private-key' in [interface]");
+		auto private_key = interface["private-key"].value<std::string>();
+		if(not private_key.has_value())
+			msg::error_and_exit("Missing required key 'private-key' in [interface] (must be a string)");
 
 		bool have_subnet = interface.contains("subnet");
 		bool have_address = interface.contains("address");
@@ -88,26 +89,32 @@ namespace wg
 			msg::error_and_exit("[interface] must specify only one of 'subnet' or 'address' (not both)");
 
 		std::optional<int64_t> port {};
-		if(interface.contains("port") && not interface["port"].is_integer())
-			msg::error_and_exit("'port' key must be an integer");
-		else if(interface.contains("port"))
-			port = *interface["port"].value<int64_t>();
+		if(auto tmp = interface["port"]; tmp)
+		{
+			if(not tmp.is_integer())
+				msg::error_and_exit("'port' key must be an integer");
+
+			port = *tmp.value<int64_t>();
+		}
 
 		if(port.has_value() && not(1 <= port && port <= 65535))
 			msg::error_and_exit("'port' must be between 1 and 65535");
 
 		std::optional<int> mtu {};
-		if(interface.contains("mtu") && not interface["mtu"].is_integer())
-			msg::error_and_exit("'mtu' must be an integer");
-		else if(interface.contains("mtu"))
-			mtu = *interface["mtu"].value<int64_t>();
+		if(auto tmp = interface["mtu"]; tmp)
+		{
+			if(not tmp.is_integer())
+				msg::error_and_exit("'mtu' must be an integer");
+
+			mtu = *tmp.value<int64_t>();
+		}
 
 		std::string address_or_subnet {};
 		if(have_subnet)
 		{
 			auto subnet = *interface["subnet"].value<std::string>();
-			auto cidr_regex = std::regex(R"(([0-9]{1,3})(\.[0-9]{1,3}){3}/[0-9]+)");
-			if(not std::regex_match(subnet, cidr_regex))
+			static const auto SUBNET_REGEX = std::regex(R"((?:[0-9]{1,3}\.){3}[0-9]{1,3}/[0-9]{1,3})");
+			if(not std::regex_match(subnet, SUBNET_REGEX))
 				msg::error_and_exit("Invalid 'subnet' specification; expected subnet in CIDR notation");
 
 			address_or_subnet = std::move(subnet);
@@ -117,8 +124,8 @@ namespace wg
 			assert(have_address);
 
 			auto address = *interface["address"].value<std::string>();
-			auto cidr_regex = std::regex(R"(([0-9]{1,3})(\.[0-9]{1,3}){3})");
-			if(not std::regex_match(address, cidr_regex))
+			static const auto ADDRESS_REGEX = std::regex(R"((?:[0-9]{1,3}\.){3}[0-9]{1,3})");
+			if(not std::regex_match(address, ADDRESS_REGEX))
 				msg::error_and_exit("Invalid 'address' specification; expected IPv4 address (without CIDR suffix)");
 
 			address_or_subnet = zpr::sprint("{}/32", address);
@@ -142,17 +149,22 @@ namespace wg
 					msg::error_and_exit("Invalid specification for peer '{}': expected a table", name);
 
 				auto& peer = *_peer.as_table();
-				if(not peer.contains("public-key") || not peer["public-key"].is_string())
+				auto public_key = peer["public-key"].value<std::string>();
+				if(not public_key.has_value())
 					msg::error_and_exit("Missing required key 'public-key' for peer '{}' (must be a string)", name);
-				else if(not peer.contains("ip") || not peer["ip"].is_string())
+
+				auto maybe_ip = peer["ip"].value<std::string>();
+				if(not maybe_ip.has_value())
 					msg::error_and_exit("Missing required key 'ip' for peer '{}' (must be a string)", name);
 
-				auto ip = *peer["ip"].value<std::string>();
-				auto ip_regex = std::regex(R"(([0-9]{1,3})(\.[0-9]{1,3}){3}(/[0-9]+)?)");
-				if(not std::regex_match(ip, ip_regex))
+				auto ip = std::move(*maybe_ip);
+				static const auto PEER_IP_REGEX = std::regex(R"((?:[0-9]{1,3}\.){3}[0-9]{1,3}(/[0-9]{1,3})?)");
+				std::smatch ip_match {};
+				if(not std::regex_match(ip, ip_match, PEER_IP_REGEX))
 					msg::error_and_exit("Invalid IP address '{}' for peer '{}'", ip, name);
 
-				if(ip.find("/") == std::string::npos)
+				// the only capture group is the (optional) cidr suffix
+				if(not ip_match[1].matched)
 					ip += "/32";
 
 				std::optional<int> keepalive {};
@@ -173,8 +185,9 @@ namespace wg
 					if(not tmp.is_string())
 						msg::error_and_exit("'endpoint' must be a string");
 
-					auto ep = *peer["endpoint"].value<std::string>();
-					if(not std::regex_match(ep, std::regex(R"((.+):([0-9]+))")))
+					auto ep = *tmp.value<std::string>();
+					static const auto ENDPOINT_REGEX = std::regex(R"(.+:[0-9]{1,5})");
+					if(not std::regex_match(ep, ENDPOINT_REGEX))
 						msg::error_and_exit("Expected endpoint format: '<ip/url>:<port>'");
 					else
 						endpoint = std::move(ep);
@@ -187,7 +200,7 @@ namespace wg
 					psk = *tmp1.value<std::string>();
 
 				if(psk.has_value())
-					psk = read_key(*psk);
+					psk = read_key(*psk, base_dir);
 
 
 				std::vector<std::string> extra_routes {};
@@ -209,7 +222,7 @@ namespace wg
 				peers.push_back(Peer {
 				    .name = std::string(name),
 				    .ip = ip,
-				    .public_key = read_key(*peer["public-key"].value<std::string>()),
+				    .public_key = read_key(*public_key, base_dir),
 				    .pre_shared_key = psk,
 				    .keepalive = keepalive,
 				    .endpoint = std::move(endpoint),
@@ -250,6 +263,10 @@ namespace wg
 		if(interface.contains("dns") and not use_wg_quick)
 			msg::warn("'dns' setting is only used when 'use-wg-quick' is true");
 
+		decltype(Config::peer_index) peer_index {};
+		for(size_t i = 0; i < peers.size(); i++)
+			peer_index.try_emplace(peers[i].public_key, i);
+
 		return Config {
 			.name = file_path.filename().string(),
 			.nickname = interface["nickname"].value<std::string>(),
@@ -263,50 +280,83 @@ namespace wg
 			.auto_masquerade = auto_masquerade,
 			.post_up_cmd = interface["post-up"].value<std::string>(),
 			.post_down_cmd = interface["post-down"].value<std::string>(),
-			.private_key = read_key(*interface["private-key"].value<std::string>()),
+			.directory = base_dir.string(),
+			.private_key = read_key(*private_key, base_dir),
 			.peers = std::move(peers),
+			.peer_index = std::move(peer_index),
 		};
 	}
 
-	std::optional<Peer> Config::lookup_peer_from_pubkey(zst::str_view pubkey) const
+	Config Config::load(const std::string& filename)
 	{
-		for(auto& peer : this->peers)
+		// open the file directly instead of checking that it exists first
+		int fd = open(filename.c_str(), O_RDONLY);
+		if(fd < 0 && errno == ENOENT)
+		{
+			msg::error_and_exit("Interface '{}' does not exist (no config file at {})",
+			    stdfs::path(filename).stem().string(), filename);
+		}
+		else if(fd < 0)
 		{
-			if(peer.public_key == pubkey)
-				return peer;
+			msg::error_and_exit("Could not read config file {}: {}", filename, strerror(errno));
 		}
 
-		return std::nullopt;
+		auto close_file = util::defer([fd]() { close(fd); });
+
+		// read the whole file in one go and parse it from memory
+		auto contents = util::read_entire_file(fd, filename);
+		if(contents.is_err())
+			exit(1);
+
+		return parse_config(filename, zst::byte_span(contents->get(), contents->size()).chars().sv());
 	}
 
-	std::string Config::to_wg_conf() const
+	std::optional<Peer> Config::lookup_peer_from_pubkey(zst::str_view pubkey) const
 	{
-		std::string ret {};
-		ret += "[Interface]\n";
-		ret += zpr::sprint("PrivateKey = {}\n", this->private_key);
-		if(this->port.has_value())
-			ret += zpr::sprint("ListenPort = {}\n", *this->port);
+		if(auto it = this->peer_index.find(pubkey.sv()); it != this->peer_index.end())
+			return this->peers[it->second];
 
-		ret += "\n";
-		for(auto& peer : this->peers)
+		return std::nullopt;
+	}
+
+	static void append_peers(std::string& out, const std::vector<Peer>& peers)
+	{
+		for(auto& peer : peers)
 		{
-			ret += zpr::sprint("[Peer]\n");
-			auto allowed_ips = peer.ip;
+			util::append_fmt(out, "[Peer]\nAllowedIPs = {}", peer.ip);
 			for(auto& extra_ip : peer.extra_routes)
-				allowed_ips += zpr::sprint(", {}", extra_ip);
+				util::append_fmt(out, ", {}", extra_ip);
 
-			ret += zpr::sprint("AllowedIPs = {}\n", allowed_ips);
-			ret += zpr::sprint("PublicKey = {}\n", peer.public_key);
+			util::append_fmt(out, "\nPublicKey = {}\n", peer.public_key);
 
 			if(peer.pre_shared_key.has_value())
-				ret += zpr::sprint("PresharedKey = {}\n", *peer.pre_shared_key);
+				util::append_fmt(out, "PresharedKey = {}\n", *peer.pre_shared_key);
 			if(peer.keepalive.has_value())
-				ret += zpr::sprint("PersistentKeepalive = {}\n", *peer.keepalive);
+				util::append_fmt(out, "PersistentKeepalive = {}\n", *peer.keepalive);
 			if(peer.endpoint.has_value())
-				ret += zpr::sprint("Endpoint = {}\n", *peer.endpoint);
+				util::append_fmt(out, "Endpoint = {}\n", *peer.endpoint);
 
-			ret += "\n";
+			out += "\n";
 		}
+	}
+
+	// rough upper bound for the size of the generated config, so the string is only allocated once
+	static size_t estimate_conf_size(const Config& config)
+	{
+		return 512 + 256 * config.peers.size();
+	}
+
+	std::string Config::to_wg_conf() const
+	{
+		std::string ret {};
+		ret.reserve(estimate_conf_size(*this));
+
+		util::append_fmt(ret, "[Interface]\nPrivateKey = {}\n", this->private_key);
+		if(this->port.has_value())
+			util::append_fmt(ret, "ListenPort = {}\n", *this->port);
+
+		ret += "\n";
+		append_peers(ret, this->peers);
 
 		return ret;
 	}
@@ -314,57 +364,44 @@ namespace wg
 	std::string Config::to_wg_quick_conf() const
 	{
 		std::string ret {};
-		ret += "[Interface]\n";
-		ret += zpr::sprint("Address = {}\n", this->subnet);
-		ret += zpr::sprint("SaveConfig = false\n");
-		ret += zpr::sprint("PrivateKey = {}\n", this->private_key);
+		ret.reserve(estimate_conf_size(*this));
+
+		util::append_fmt(ret, "[Interface]\nAddress = {}\nSaveConfig = false\nPrivateKey = {}\n", this->subnet,
+		    this->private_key);
+
 		if(this->mtu.has_value())
-			ret += zpr::sprint("MTU = {}\n", *this->mtu);
+			util::append_fmt(ret, "MTU = {}\n", *this->mtu);
 
 		if(this->port.has_value())
-			ret += zpr::sprint("ListenPort = {}\n", *this->port);
+			util::append_fmt(ret, "ListenPort = {}\n", *this->port);
 
 		if(this->dns.has_value())
-			ret += zpr::sprint("DNS = {}\n", *this->dns);
+			util::append_fmt(ret, "DNS = {}\n", *this->dns);
 
 		if(this->auto_forward)
 		{
-			ret += zpr::sprint("PostUp = iptables -I FORWARD 1 -i {} -j ACCEPT\n", this->name);
-			ret += zpr::sprint("PostDown = iptables -D FORWARD -i {} -j ACCEPT\n", this->name);
+			util::append_fmt(ret,
+			    "PostUp = iptables -I FORWARD 1 -i {} -j ACCEPT\n"
+			    "PostDown = iptables -D FORWARD -i {} -j ACCEPT\n",
+			    this->name, this->name);
 		}
 
 		if(this->auto_masquerade)
 		{
 			assert(this->interface.has_value());
-			ret += zpr::sprint("PostUp = iptables -t nat -I POSTROUTING 1 -o {} -j MASQUERADE\n", *this->interface);
-			ret += zpr::sprint("PostDown = iptables -t nat -D POSTROUTING -o {} -j MASQUERADE\n", *this->interface);
+			util::append_fmt(ret,
+			    "PostUp = iptables -t nat -I POSTROUTING 1 -o {} -j MASQUERADE\n"
+			    "PostDown = iptables -t nat -D POSTROUTING -o {} -j MASQUERADE\n",
+			    *this->interface, *this->interface);
 		}
 
 		if(this->post_up_cmd.has_value())
-			ret += zpr::sprint("PostUp = {}\n", *this->post_up_cmd);
+			util::append_fmt(ret, "PostUp = {}\n", *this->post_up_cmd);
 		if(this->post_down_cmd.has_value())
-			ret += zpr::sprint("PostDown = {}\n", *this->post_down_cmd);
+			util::append_fmt(ret, "PostDown = {}\n", *this->post_down_cmd);
 
 		ret += "\n";
-		for(auto& peer : this->peers)
-		{
-			ret += zpr::sprint("[Peer]\n");
-			auto allowed_ips = peer.ip;
-			for(auto& extra_ip : peer.extra_routes)
-				allowed_ips += zpr::sprint(", {}", extra_ip);
-
-			ret += zpr::sprint("AllowedIPs = {}\n", allowed_ips);
-			ret += zpr::sprint("PublicKey = {}\n", peer.public_key);
-
-			if(peer.pre_shared_key.has_value())
-				ret += zpr::sprint("PresharedKey = {}\n", *peer.pre_shared_key);
-			if(peer.keepalive.has_value())
-				ret += zpr::sprint("PersistentKeepalive = {}\n", *peer.keepalive);
-			if(peer.endpoint.has_value())
-				ret += zpr::sprint("Endpoint = {}\n", *peer.endpoint);
-
-			ret += "\n";
-		}
+		append_peers(ret, this->peers);
 
 		return ret;
 	}
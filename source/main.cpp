@@ -22,6 +22,7 @@ static void print_help()
 	zpr::println("  up                  bring up an interface");
 	zpr::println("  down                bring down an interface");
 	zpr::println("  restart             restart (down then up) an interface");
+	zpr::println("  reload              update the keys and peers of an interface without restarting it");
 	zpr::println("");
 	zpr::println("Common options:");
 	zpr::println("  -h, --help          show help for a subcommand");
@@ -89,7 +90,7 @@ int main(int argc, char** argv)
 		wg::status(dir, iface, /* show_keys: */ args.has_option("keys"),
 		    /* show_extra_routes: */ args.has_option("routes"));
 	}
-	else if(cmd == "up" || cmd == "down" || cmd == "restart")
+	else if(cmd == "up" || cmd == "down" || cmd == "restart" || cmd == "reload")
 	{
 		if(args.has_option("help"))
 		{
@@ -104,11 +105,17 @@ int main(int argc, char** argv)
 				zpr::println("Usage: wgman down INTERFACE\n");
 				zpr::println("Bring down an existing WireGuard interface; it must exist.");
 			}
-			else
+			else if(cmd == "restart")
 			{
 				zpr::println("Usage: wgman restart INTERFACE\n");
 				zpr::println("Restart an existing WireGuard interface; it must exist.");
 			}
+			else
+			{
+				zpr::println("Update the keys and peers of a WireGuard interface in-place (using `wg syncconf`),");
+				zpr::println("without taking it down. Changes to the address, routes, or hooks need a restart.");
+				zpr::println("If the interface does not exist, it is brought up instead.");
+			}
 
 			zpr::println("Does not take additional options.");
 			return 0;
@@ -120,7 +127,7 @@ int main(int argc, char** argv)
 		if(wg::check_perms() != wg::perms::ROOT)
 			msg::error_and_exit("Insufficient permissions");
 
-		auto fn = (cmd == "up" ? &wg::up : cmd == "down" ? &wg::down : &wg::restart);
+		auto fn = (cmd == "up" ? &wg::up : cmd == "down" ? &wg::down : cmd == "restart" ? &wg::restart : &wg::reload);
 		if(fn(wg::Config::load(zpr::sprint("{}/{}.toml", dir, args.positional[0]))).is_err())
 			return 1;
 	}
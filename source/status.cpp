@@ -5,9 +5,13 @@
 #include <assert.h>
 #include <cstdlib>
 
+#include <bit>
 #include <chrono>
+#include <charconv>
+#include <iterator>
 #include <algorithm>
 #include <filesystem>
+#include <unordered_map>
 
 #include "wgman.h"
 #include "zprocpipe.h"
@@ -18,61 +22,137 @@ namespace wg
 	namespace zpp = zprocpipe;
 	namespace stdfs = std::filesystem;
 
-	static std::string time_to_relative_string(int64_t time)
+	static constexpr const char* NONE_STR = MSG_GREY "none";
+	static constexpr const char* NEVER_STR = MSG_GREY "never";
+
+	static int64_t current_unix_time()
 	{
 		namespace sc = std::chrono;
-		auto diff = sc::duration_cast<sc::seconds>(sc::system_clock::now().time_since_epoch()).count() - time;
-		assert(diff >= 0);
+		return sc::duration_cast<sc::seconds>(sc::system_clock::now().time_since_epoch()).count();
+	}
 
-		auto [days, r1] = std::div(diff, decltype(diff)(86400));
-		auto [hrs, r2] = std::div(r1, decltype(diff)(3600));
-		auto [mins, secs] = std::div(r2, decltype(diff)(60));
+	static std::string time_to_relative_string(int64_t time, int64_t now)
+	{
+		auto diff = now - time;
+		assert(diff >= 0);
 
-		if(days > 0)
+		// only compute the two units that are actually printed
+		if(diff >= 86400)
 		{
-			if(hrs > 0)
-				return zpr::sprint("{}d {}h", days, hrs);
-			else
-				return zpr::sprint("{}d", days);
+			auto days = diff / 86400;
+			auto hrs = (diff % 86400) / 3600;
+			return hrs > 0 ? zpr::sprint("{}d {}h", days, hrs) : zpr::sprint("{}d", days);
 		}
-		else if(hrs > 0)
+		else if(diff >= 3600)
 		{
-			return zpr::sprint("{}h {}m", hrs, mins);
+			return zpr::sprint("{}h {}m", diff / 3600, (diff % 3600) / 60);
 		}
-		else if(mins > 0)
+		else if(diff >= 60)
 		{
-			return zpr::sprint("{}m {}s", mins, secs);
+			return zpr::sprint("{}m {}s", diff / 60, diff % 60);
 		}
 		else
 		{
-			return zpr::sprint("{}s", secs);
+			return zpr::sprint("{}s", diff);
 		}
 	}
 
 	static std::string bytes_to_string(uint64_t n)
 	{
-		if(n < 1024)
+		constexpr const char* UNITS[] = { "b", "k", "M", "G", "T" };
+
+		// each unit is 1024 times the previous one, so the unit follows directly from the bit width.
+		auto unit = std::min(static_cast<size_t>(std::bit_width(n | 1) - 1) / 10, std::size(UNITS) - 1);
+		if(unit == 0)
 			return zpr::sprint("{}b", n);
-		else if(n < 1024ull * 1024ull)
-			return zpr::sprint("{.1f}k", static_cast<double>(n) / 1024.0);
-		else if(n < 1024ull * 1024ull * 1024ull)
-			return zpr::sprint("{.1f}M", static_cast<double>(n) / 1024.0 / 1024.0);
-		else if(n < 1024ull * 1024ull * 1024ull * 1024ull)
-			return zpr::sprint("{.1f}G", static_cast<double>(n) / 1024.0 / 1024.0 / 1024.0);
-		else
-			return zpr::sprint("{.1f}T", static_cast<double>(n) / 1024.0 / 1024.0 / 1024.0 / 1024.0);
+
+		return zpr::sprint("{.1f}{}", static_cast<double>(n) / static_cast<double>(1ull << (10 * unit)), UNITS[unit]);
 	}
 
-	static Result<zpp::Process, std::string> wg_show(const std::string& iface)
+	template <typename T>
+	static T parse_number(zst::str_view sv)
+	{
+		T ret = 0;
+		auto end = sv.data() + sv.size();
+		if(auto [ptr, ec] = std::from_chars(sv.data(), end, ret); ec != std::errc() || ptr != end)
+			msg::error_and_exit("Malformed number in wg dump: '{}'", sv);
+
+		return ret;
+	}
+
+	using WgDump = std::unordered_map<std::string, std::vector<std::string>>;
+
+	// runs `wg show all dump` once, and splits the output by interface. the interface name prefix
+	// is stripped from each line, so the lines are the same as the output of `wg show <iface> dump`.
+	static Result<WgDump, std::string> wg_show_all()
 	{
 		set_ambient_perms();
-		auto [proc, err] = zpp::runProcess("wg", { "show", iface, "dump" }, /* stdout: */ true, /* stderr: */ false);
+		auto [proc, err] = zpp::runProcess("wg", { "show", "all", "dump" }, /* stdout: */ true, /* stderr: */ false);
 		reset_ambient_perms();
 
 		if(not proc.has_value())
-			return Err(zpr::sprint("Could not read '{}': {}", iface, std::move(err)));
+			return Err(zpr::sprint("Could not run `wg show`: {}", std::move(err)));
+
+		WgDump ret {};
+		while(true)
+		{
+			auto line = proc->readStdoutLine();
+			if(line.empty())
+				break;
+
+			auto sv = zst::str_view(line);
+			auto iface = sv.take_prefix(sv.find_first_of(" \t"));
+			ret[iface.str()].push_back(util::trim(sv).str());
+		}
+
+		if(auto code = proc->wait(); code != 0)
+			return Err(zpr::sprint("`wg show` exited with non-zero code {}", code));
 
-		return Ok(std::move(*proc));
+		return Ok(std::move(ret));
+	}
+
+	struct PeerStatus
+	{
+		zst::str_view public_key;
+		std::optional<std::pair<zst::str_view, zst::str_view>> endpoint;
+		std::vector<std::pair<zst::str_view, int>> ips;
+		int64_t last_handshake;
+		uint64_t rx_bytes;
+		uint64_t tx_bytes;
+	};
+
+	// parses one peer line of `wg show <iface> dump`, exiting if any field is malformed.
+	static PeerStatus parse_peer_status(const std::vector<zst::str_view>& parts, bool show_extra_routes)
+	{
+		PeerStatus ret {};
+		ret.public_key = parts[0];
+
+		for(auto ip_part : util::split_by(parts[3], ','))
+		{
+			if(ip_part.ends_with("/32"))
+				ip_part.remove_suffix(3);
+
+			auto [_, cidr] = util::parse_ip(ip_part);
+			ret.ips.emplace_back(ip_part.take_until('/'), cidr);
+
+			// only the routes that are printed are parsed
+			if(not show_extra_routes)
+				break;
+		}
+
+		if(auto endpoint_str = parts[2]; endpoint_str != "(none)")
+		{
+			auto x = endpoint_str.find(':');
+			if(x == std::string::npos)
+				msg::error_and_exit("Malformed endpoint string '{}' -- missing port", endpoint_str);
+
+			ret.endpoint = std::make_pair(endpoint_str.take(x), endpoint_str.drop(x + 1));
+		}
+
+		ret.last_handshake = parse_number<int64_t>(parts[4]);
+		ret.rx_bytes = parse_number<uint64_t>(parts[5]);
+		ret.tx_bytes = parse_number<uint64_t>(parts[6]);
+		return ret;
 	}
 
 	void status(const std::string& config_path_,
@@ -85,12 +165,7 @@ namespace wg
 		std::vector<std::string> interfaces;
 		if(interface.has_value())
 		{
-			std::error_code ec {};
-			if(not stdfs::exists(config_path / (*interface + ".toml"), ec) && !ec)
-				msg::error_and_exit("Interface '{}' does not exist", *interface);
-			else if(ec)
-				msg::error_and_exit("Could not load config file for interface '{}': {}", *interface, ec.message());
-
+			// no need to check that the file exists; Config::load will complain if it doesn't.
 			interfaces.push_back(*interface);
 		}
 		else
@@ -98,12 +173,10 @@ namespace wg
 			std::error_code ec {};
 			for(auto& dir : stdfs::directory_iterator(config_path, ec))
 			{
-				auto path = dir.path();
-				if(path.extension() == ".toml")
-				{
-					path.replace_extension("");
-					interfaces.push_back(path.filename());
-				}
+				auto filename = dir.path().filename();
+				auto name = zst::str_view(filename.native());
+				if(name.ends_with(".toml") && name.size() > 5)
+					interfaces.push_back(name.drop_last(5).str());
 			}
 
 			if(ec)
@@ -111,16 +184,39 @@ namespace wg
 		}
 
 		std::sort(interfaces.begin(), interfaces.end());
+
+		// only run `wg show` once we know that at least one interface is up
+		std::optional<Result<WgDump, std::string>> wg_dump {};
+		int64_t now = 0;
+
+		// output for each interface is collected here and written out in one go
+		std::string out {};
+		auto print = [&out]<typename... Args>(const char* fmt, Args&&... args) {
+			util::append_fmt(out, fmt, static_cast<Args&&>(args)...);
+		};
+
+		auto println = [&out]<typename... Args>(const char* fmt, Args&&... args) {
+			util::append_fmt(out, fmt, static_cast<Args&&>(args)...);
+			out += '\n';
+		};
+
+		auto flush = [&out]() {
+			fwrite(out.data(), 1, out.size(), stdout);
+			out.clear();
+		};
+
 		for(auto& wg_iface : interfaces)
 		{
+			auto flush_output = util::defer([&flush]() { flush(); });
+
 			auto config = Config::load(config_path / (wg_iface + ".toml"));
-			zpr::print("{}", msg::ALL_OFF);
+			print("{}", msg::ALL_OFF);
 
 #if defined(__APPLE__)
 			auto maybe_real_iface = macos_get_real_interface(wg_iface, /* quiet: */ true);
 			if(maybe_real_iface.is_err())
 			{
-				zpr::println("{}interface {}{}{}: {}down{}", msg::BOLD, msg::GREEN, wg_iface, //
+				println("{}interface {}{}{}: {}down{}", msg::BOLD, msg::GREEN, wg_iface, //
 				    msg::ALL_OFF, msg::RED, msg::ALL_OFF);
 				continue;
 			}
@@ -130,85 +226,54 @@ namespace wg
 			auto& iface = wg_iface;
 			if(not does_interface_exist(iface))
 			{
-				zpr::println("{}interface {}{}{}: {}down{}", msg::BOLD, msg::GREEN, iface, //
+				println("{}interface {}{}{}: {}down{}", msg::BOLD, msg::GREEN, iface, //
 				    msg::ALL_OFF, msg::RED, msg::ALL_OFF);
 				continue;
 			}
 #endif
 
-			auto maybe_proc = wg_show(iface);
-			if(maybe_proc.is_err())
+			if(not wg_dump.has_value())
 			{
-				msg::error("{}", maybe_proc.error());
-				continue;
+				// wg writes its errors straight to the terminal, so print everything before it first
+				flush();
+				wg_dump = wg_show_all();
+
+				// read the clock once, after the dump; handshake times are all relative to this
+				now = current_unix_time();
 			}
 
-			if(auto code = maybe_proc->wait(); code != 0)
+			if(wg_dump->is_err())
 			{
-				msg::error("`wg show` exited with non-zero code {}", code);
+				println("{}interface {}{}{}: {}error{} ({})", msg::BOLD, msg::GREEN, wg_iface, //
+				    msg::ALL_OFF, msg::RED, msg::ALL_OFF, wg_dump->error());
 				continue;
 			}
 
-			auto iface_ip = zst::str_view(config.subnet).take_until('/');
-			auto iface_cidr = zst::str_view(config.subnet).drop_until('/').drop(1);
-
+			auto dump_it = (*wg_dump)->find(iface);
+			if(dump_it == (*wg_dump)->end() || dump_it->second.empty())
 			{
-#if defined(__APPLE__)
-				if(config.nickname.has_value())
-				{
-					zpr::println("{}interface {}{}{} ({}{}{}: {}{}{})", msg::BOLD, //
-					    msg::GREEN, *config.nickname, msg::ALL_OFF,                //
-					    msg::BLUE, wg_iface, msg::ALL_OFF,                         //
-					    msg::BLUE, iface, msg::ALL_OFF                             //
-					);
-				}
-				else
-				{
-					zpr::println("{}interface {}{}{} ({}{}{})", msg::BOLD, //
-					    msg::GREEN, wg_iface, msg::ALL_OFF,                //
-					    msg::BLUE, iface, msg::ALL_OFF                     //
-					);
-				}
-#else
-				if(config.nickname.has_value())
-				{
-					zpr::println("{}interface {}{}{} ({}{}{})", msg::BOLD, //
-					    msg::GREEN, *config.nickname, msg::ALL_OFF,        //
-					    msg::BLUE, wg_iface, msg::ALL_OFF                  //
-					);
-				}
-				else
-				{
-					zpr::println("{}interface {}{}{}", msg::BOLD, msg::GREEN, wg_iface, msg::ALL_OFF);
-				}
-#endif
+				println("{}interface {}{}{}: {}error{} (not a WireGuard interface)", msg::BOLD, msg::GREEN,
+				    wg_iface, msg::ALL_OFF, msg::RED, msg::ALL_OFF);
+				continue;
 			}
 
-			zpr::println("  {}address:{}  {}{}{}{}/{}{}", msg::BOLD, msg::ALL_OFF, msg::YELLOW, iface_ip, msg::ALL_OFF,
-			    msg::BLUE_NB, iface_cidr, msg::ALL_OFF);
+			auto& lines = dump_it->second;
+			std::vector<std::vector<zst::str_view>> line_parts {};
+			for(auto& line : lines)
+				line_parts.push_back(util::split_by_spaces(line));
 
-			if(config.dns.has_value())
-				zpr::println("  {}dns:{}      {}{}{}", msg::BOLD, msg::ALL_OFF, msg::PINK, *config.dns, msg::ALL_OFF);
+			// validate and parse the whole dump before printing anything for this interface, so that
+			// a malformed line does not leave a half-printed interface behind.
+			if(line_parts[0].size() != 4)
+				msg::error_and_exit("Malformed output from wg dump: '{}'", lines[0]);
 
-			std::vector<std::string> lines {};
-			while(true)
+			for(size_t i = 1; i < line_parts.size(); i++)
 			{
-				auto line = maybe_proc->readStdoutLine();
-				if(line.empty())
-					break;
-				lines.push_back(std::move(line));
+				if(line_parts[i].size() != 8)
+					msg::error_and_exit("Malformed output from wg dump: '{}'", line_parts[i]);
 			}
 
-			std::vector<std::vector<zst::str_view>> line_parts {};
-			for(auto& line : lines)
-				line_parts.push_back(util::split_by_spaces(line));
-
 			std::sort(1 + line_parts.begin(), line_parts.end(), [](const auto& p1, const auto& p2) {
-				if(p1.size() != 8)
-					msg::error_and_exit("Malformed output from wg dump: '{}'", p1);
-				if(p2.size() != 8)
-					msg::error_and_exit("Malformed output from wg dump: '{}'", p2);
-
 				auto p1_ip = p1[3];
 				auto p2_ip = p2[3];
 
@@ -243,130 +308,137 @@ namespace wg
 				return false;
 			});
 
+			std::vector<PeerStatus> peers {};
+			for(size_t i = 1; i < line_parts.size(); i++)
+				peers.push_back(parse_peer_status(line_parts[i], show_extra_routes));
+
+			auto iface_ip = zst::str_view(config.subnet).take_until('/');
+			auto iface_cidr = zst::str_view(config.subnet).drop_until('/').drop(1);
 
-			for(size_t i = 0; i < lines.size(); i++)
 			{
-				auto& parts = line_parts[i];
-				if(i == 0)
+#if defined(__APPLE__)
+				if(config.nickname.has_value())
 				{
-					if(parts.size() != 4)
-						msg::error_and_exit("Malformed output from wg dump: '{}'", lines[0]);
-
-					if(show_keys)
-					{
-						zpr::println("  {}pubkey:{}   {}{}{}\n", msg::BOLD, msg::ALL_OFF, msg::PINK_NB, parts[1],
-						    msg::ALL_OFF);
-					}
-					else
-					{
-						zpr::println("");
-					}
+					println("{}interface {}{}{} ({}{}{}: {}{}{})", msg::BOLD, //
+					    msg::GREEN, *config.nickname, msg::ALL_OFF,           //
+					    msg::BLUE, wg_iface, msg::ALL_OFF,                    //
+					    msg::BLUE, iface, msg::ALL_OFF                        //
+					);
 				}
 				else
 				{
-					auto pub_key = parts[0];
-					auto endpoint_str = parts[2];
-					auto ip_str_ = parts[3];
-					auto last_handshake = parts[4];
-					auto rx_bytes = parts[5];
-					auto tx_bytes = parts[6];
-
-					std::vector<zst::str_view> ips {};
-					for(auto ip_part : util::split_by(ip_str_, ','))
-					{
-						if(ip_part.ends_with("/32"))
-							ip_part.remove_suffix(3);
+					println("{}interface {}{}{} ({}{}{})", msg::BOLD, //
+					    msg::GREEN, wg_iface, msg::ALL_OFF,           //
+					    msg::BLUE, iface, msg::ALL_OFF                //
+					);
+				}
+#else
+				if(config.nickname.has_value())
+				{
+					println("{}interface {}{}{} ({}{}{})", msg::BOLD, //
+					    msg::GREEN, *config.nickname, msg::ALL_OFF,   //
+					    msg::BLUE, wg_iface, msg::ALL_OFF             //
+					);
+				}
+				else
+				{
+					println("{}interface {}{}{}", msg::BOLD, msg::GREEN, wg_iface, msg::ALL_OFF);
+				}
+#endif
+			}
 
-						ips.push_back(ip_part);
-					}
+			println("  {}address:{}  {}{}{}{}/{}{}", msg::BOLD, msg::ALL_OFF, msg::YELLOW, iface_ip, msg::ALL_OFF,
+			    msg::BLUE_NB, iface_cidr, msg::ALL_OFF);
 
-					std::string peer_name {};
-					bool unknown_peer = false;
-					if(auto maybe_peer = config.lookup_peer_from_pubkey(pub_key); maybe_peer.has_value())
-					{
-						peer_name = maybe_peer->name;
-					}
-					else
-					{
-						unknown_peer = true;
-						peer_name = "unknown";
-					}
+			if(config.dns.has_value())
+				println("  {}dns:{}      {}{}{}", msg::BOLD, msg::ALL_OFF, msg::PINK, *config.dns, msg::ALL_OFF);
 
-					zpr::print("  {}peer {}{}{} (", msg::BOLD, (unknown_peer ? msg::RED : msg::BLUE), peer_name,
-					    msg::ALL_OFF);
+			if(show_keys)
+			{
+				println("  {}pubkey:{}   {}{}{}\n", msg::BOLD, msg::ALL_OFF, msg::PINK_NB, line_parts[0][1],
+				    msg::ALL_OFF);
+			}
+			else
+			{
+				println("");
+			}
 
-					for(size_t k = 0; k < ips.size(); k++)
-					{
-						auto [_, cidr] = util::parse_ip(ips[k]);
-						if(k > 0)
-							zpr::print(", ");
+			for(auto& peer : peers)
+			{
+				std::string peer_name {};
+				bool unknown_peer = false;
+				if(auto maybe_peer = config.lookup_peer_from_pubkey(peer.public_key); maybe_peer.has_value())
+				{
+					peer_name = maybe_peer->name;
+				}
+				else
+				{
+					unknown_peer = true;
+					peer_name = "unknown";
+				}
 
-						zpr::print("{}{}{}{}/{}{}", msg::YELLOW, ips[k].take_until('/'), msg::ALL_OFF, msg::BLUE_NB,
-						    cidr, msg::ALL_OFF);
+				print("  {}peer {}{}{} (", msg::BOLD, (unknown_peer ? msg::RED : msg::BLUE), peer_name, msg::ALL_OFF);
 
-						if(not show_extra_routes)
-							break;
-					}
+				for(size_t k = 0; k < peer.ips.size(); k++)
+				{
+					if(k > 0)
+						print(", ");
 
-					zpr::println(")");
+					auto& [ip, cidr] = peer.ips[k];
+					print("{}{}{}{}/{}{}", msg::YELLOW, ip, msg::ALL_OFF, msg::BLUE_NB, cidr, msg::ALL_OFF);
+				}
 
-					struct
-					{
-						std::string endpoint;
-						std::string handshake;
-						std::string ago;
-						std::string tx;
-						std::string rx;
-					} print_args;
-
-					if(endpoint_str == "(none)")
-					{
-						print_args.endpoint = zpr::sprint("{}none", msg::GREY);
-					}
-					else
-					{
-						auto x = endpoint_str.find(':');
-						if(x == std::string::npos)
-							msg::error_and_exit("Malformed endpoint string '{}' -- missing port", endpoint_str);
-
-						auto ip = endpoint_str.take(x);
-						auto port = endpoint_str.drop(x + 1);
-						print_args.endpoint = zpr::sprint("{}{}{}{}:{}", msg::PINK_NB, ip, msg::ALL_OFF, msg::GREY,
-						    port);
-					}
+				println(")");
 
-					if(last_handshake != "0")
-					{
-						print_args.handshake = time_to_relative_string(std::stoll(last_handshake.str()));
-						print_args.ago = " ago";
-					}
-					else
-					{
-						print_args.handshake = zpr::sprint("{}never", msg::GREY);
-						print_args.ago = "";
-					}
+				struct
+				{
+					std::string endpoint;
+					std::string handshake;
+					std::string ago;
+					std::string tx;
+					std::string rx;
+				} print_args;
+
+				if(peer.endpoint.has_value())
+				{
+					auto& [ip, port] = *peer.endpoint;
+					print_args.endpoint = zpr::sprint("{}{}{}{}:{}", msg::PINK_NB, ip, msg::ALL_OFF, msg::GREY, port);
+				}
+				else
+				{
+					print_args.endpoint = NONE_STR;
+				}
 
-					print_args.tx = bytes_to_string(static_cast<uint64_t>(std::stoull(tx_bytes.str())));
-					print_args.rx = bytes_to_string(static_cast<uint64_t>(std::stoull(rx_bytes.str())));
+				if(peer.last_handshake != 0)
+				{
+					print_args.handshake = time_to_relative_string(peer.last_handshake, now);
+					print_args.ago = " ago";
+				}
+				else
+				{
+					print_args.handshake = NEVER_STR;
+					print_args.ago = "";
+				}
 
-					zpr::println("    {}conn:        {}{}{}", msg::BOLD, msg::ALL_OFF, print_args.endpoint,
-					    msg::ALL_OFF);
+				print_args.tx = bytes_to_string(peer.tx_bytes);
+				print_args.rx = bytes_to_string(peer.rx_bytes);
 
-					zpr::println("    {}last:        {}{}{}{}{}{}{}", msg::BOLD, msg::ALL_OFF, msg::PINK_NB,
-					    print_args.handshake, msg::ALL_OFF, msg::BOLD, print_args.ago, msg::ALL_OFF);
+				println("    {}conn:        {}{}{}", msg::BOLD, msg::ALL_OFF, print_args.endpoint, msg::ALL_OFF);
 
-					zpr::println("    {}traffic:     {}{}{}{} {}sent{}, {}{}{} {}received{}", msg::BOLD, msg::ALL_OFF,
-					    msg::PINK_NB, print_args.tx, msg::ALL_OFF, msg::BOLD, msg::ALL_OFF, msg::PINK_NB, print_args.rx,
-					    msg::ALL_OFF, msg::BOLD, msg::ALL_OFF);
+				println("    {}last:        {}{}{}{}{}{}{}", msg::BOLD, msg::ALL_OFF, msg::PINK_NB,
+				    print_args.handshake, msg::ALL_OFF, msg::BOLD, print_args.ago, msg::ALL_OFF);
 
-					if(show_keys)
-					{
-						zpr::println("    {}pubkey:{}      {}{}{}", msg::BOLD, msg::ALL_OFF, msg::PINK_NB, pub_key,
-						    msg::ALL_OFF);
-					}
+				println("    {}traffic:     {}{}{}{} {}sent{}, {}{}{} {}received{}", msg::BOLD, msg::ALL_OFF,
+				    msg::PINK_NB, print_args.tx, msg::ALL_OFF, msg::BOLD, msg::ALL_OFF, msg::PINK_NB, print_args.rx,
+				    msg::ALL_OFF, msg::BOLD, msg::ALL_OFF);
 
-					zpr::println("");
+				if(show_keys)
+				{
+					println("    {}pubkey:{}      {}{}{}", msg::BOLD, msg::ALL_OFF, msg::PINK_NB, peer.public_key,
+					    msg::ALL_OFF);
 				}
+
+				println("");
 			}
 		}
 	}
@@ -12,16 +12,6 @@
 
 namespace util
 {
-	std::pair<zprocpipe::Process, int> try_command(const std::string& cmd, const std::vector<std::string>& args)
-	{
-		auto [maybe_proc, err] = zprocpipe::runProcess(cmd, args);
-		if(not maybe_proc.has_value())
-			msg::error_and_exit("Failed to launch {}{#}: {}", cmd, args, err);
-
-		auto code = maybe_proc->wait();
-		return std::make_pair(std::move(*maybe_proc), code);
-	}
-
 	zst::str_view trim(zst::str_view sv)
 	{
 		if(sv.empty())
@@ -93,16 +83,28 @@ namespace util
 		if(fd < 0)
 			return msg::error("failed to open '{}'; open(): {}", path, strerror(errno));
 
+		// the mapping stays valid after the fd is closed
+		auto close_file = util::defer([fd]() { close(fd); });
+		return read_entire_file(fd, path);
+	}
+
+	zst::Result<zst::unique_span<uint8_t[]>, int> read_entire_file(int fd, const std::string& path)
+	{
 		struct stat st;
 		if(fstat(fd, &st) < 0)
 			return msg::error("failed to stat '{}'; fstat(): {}", path, strerror(errno));
 
 		auto size = static_cast<size_t>(st.st_size);
+		if(size == 0)
+		{
+			// mmap() refuses zero-length mappings
+			return Ok(zst::unique_span<uint8_t[]>());
+		}
+
 		auto ptr = mmap(0, size, PROT_READ, MAP_PRIVATE, fd, /* offset: */ 0);
 		if(ptr == reinterpret_cast<void*>(-1))
 			return msg::error("failed to read '{}': mmap(): {}", path, strerror(errno));
 
-		close(fd);
 		return Ok(zst::unique_span<uint8_t[]>((uint8_t*) ptr, size, [](const void* p, size_t n) {
 			munmap(const_cast<void*>(p), n);
 		}));
@@ -118,8 +120,8 @@ namespace util
 
 	IPSubnet parse_ip(zst::str_view ip_str)
 	{
-		auto ip_regex = std::regex(R"(([0-9]{1,3})(\.[0-9]{1,3}){3}(/[0-9]+)?)");
-		if(not std::regex_match(ip_str.begin(), ip_str.end(), ip_regex))
+		static const auto IP_REGEX = std::regex(R"((?:[0-9]{1,3}\.){3}[0-9]{1,3}(?:/[0-9]{1,3})?)");
+		if(not std::regex_match(ip_str.begin(), ip_str.end(), IP_REGEX))
 			msg::error_and_exit("Invalid IP address '{}'", ip_str);
 
 		uint32_t ip32 = 0;
@@ -10,6 +10,8 @@
 #include <string>
 #include <vector>
 #include <optional>
+#include <string_view>
+#include <unordered_map>
 
 #include "zpr.h"
 #include "zst.h"
@@ -49,6 +51,16 @@ namespace impl
 #define _TRY(x, L) __TRY(x, L)
 #define TRY(x) _TRY(x, __COUNTER__)
 
+namespace util
+{
+	// allows looking up std::string-keyed maps with a string_view without allocating
+	struct StringHash
+	{
+		using is_transparent = void;
+		size_t operator()(std::string_view sv) const { return std::hash<std::string_view> {}(sv); }
+	};
+}
+
 namespace wg
 {
 	struct Peer
@@ -77,9 +89,13 @@ namespace wg
 		bool auto_masquerade;
 		std::optional<std::string> post_up_cmd;
 		std::optional<std::string> post_down_cmd;
+		std::string directory;
 		std::string private_key;
 		std::vector<Peer> peers;
 
+		// public key -> index into `peers`
+		std::unordered_map<std::string, size_t, util::StringHash, std::equal_to<>> peer_index;
+
 		static Config load(const std::string& filename);
 
 		std::string to_wg_conf() const;
@@ -103,6 +119,7 @@ namespace wg
 	zst::Failable<int> up(const Config& config);
 	zst::Failable<int> down(const Config& config);
 	zst::Failable<int> restart(const Config& config);
+	zst::Failable<int> reload(const Config& config);
 	void status(const std::string& config_path,
 	    const std::optional<std::string>& interface,
 	    bool show_keys,
@@ -110,59 +127,74 @@ namespace wg
 }
 
 
+// the colours are string-literal macros so that they can be joined with other literals at compile time;
+// the msg:: constants below are the same strings, for use as format arguments
+#define MSG_GREEN "\x1b[92;1m"
+#define MSG_BLUE "\x1b[94;1m"
+#define MSG_YELLOW "\x1b[93;1m"
+#define MSG_RED "\x1b[91;1m"
+#define MSG_PINK "\x1b[95;1m"
+#define MSG_GREY "\x1b[90;1m"
+#define MSG_WHITE "\x1b[97;1m"
+#define MSG_BOLD "\x1b[1m"
+#define MSG_ALL_OFF "\x1b[0m"
+
 namespace msg
 {
-	static constexpr const char* GREEN = "\x1b[92;1m";
-	static constexpr const char* BLUE = "\x1b[94;1m";
-	static constexpr const char* YELLOW = "\x1b[93;1m";
-	static constexpr const char* RED = "\x1b[91;1m";
-	static constexpr const char* PINK = "\x1b[95;1m";
-	static constexpr const char* GREY = "\x1b[90;1m";
-	static constexpr const char* WHITE = "\x1b[97;1m";
-	static constexpr const char* BOLD = "\x1b[1m";
-	static constexpr const char* UNCOLOUR = "\x1b[0m\x1b[1m";
-	static constexpr const char* ALL_OFF = "\x1b[0m";
+	static constexpr const char* GREEN = MSG_GREEN;
+	static constexpr const char* BLUE = MSG_BLUE;
+	static constexpr const char* YELLOW = MSG_YELLOW;
+	static constexpr const char* RED = MSG_RED;
+	static constexpr const char* PINK = MSG_PINK;
+	static constexpr const char* GREY = MSG_GREY;
+	static constexpr const char* WHITE = MSG_WHITE;
+	static constexpr const char* BOLD = MSG_BOLD;
+	static constexpr const char* UNCOLOUR = MSG_ALL_OFF MSG_BOLD;
+	static constexpr const char* ALL_OFF = MSG_ALL_OFF;
 
 	static constexpr const char* PINK_NB = "\x1b[95m";
 	static constexpr const char* GREY_NB = "\x1b[90m";
 	static constexpr const char* BLUE_NB = "\x1b[94m";
 
+	// the fixed part of each log line, pre-joined so that printing a message is just one format call
+	static constexpr const char* LOG_PREFIX = MSG_GREEN "==>" MSG_ALL_OFF " " MSG_BOLD;
+	static constexpr const char* LOG2_PREFIX = MSG_BLUE "  ->" MSG_ALL_OFF " " MSG_BOLD;
+	static constexpr const char* LOG3_PREFIX = MSG_PINK "    +" MSG_ALL_OFF " ";
+	static constexpr const char* WARN_PREFIX = MSG_YELLOW "==> WARNING:" MSG_ALL_OFF " " MSG_BOLD;
+	static constexpr const char* ERROR_PREFIX = MSG_RED "==> ERROR:" MSG_ALL_OFF " " MSG_BOLD;
+
 	template <bool endl = true, typename... Args>
 	void log(const char* fmt, Args&&... args)
 	{
-		zpr::print("{}==>{} {}{}{}{}", GREEN, ALL_OFF, BOLD, zpr::fwd(fmt, static_cast<Args&&>(args)...), ALL_OFF,
-		    endl ? "\n" : "");
+		zpr::print("{}{}{}{}", LOG_PREFIX, zpr::fwd(fmt, static_cast<Args&&>(args)...), ALL_OFF, endl ? "\n" : "");
 		fflush(stdout);
 	}
 
 	template <bool endl = true, typename... Args>
 	void log2(const char* fmt, Args&&... args)
 	{
-		zpr::print("{}  ->{} {}{}{}{}", BLUE, ALL_OFF, BOLD, zpr::fwd(fmt, static_cast<Args&&>(args)...), ALL_OFF,
-		    endl ? "\n" : "");
+		zpr::print("{}{}{}{}", LOG2_PREFIX, zpr::fwd(fmt, static_cast<Args&&>(args)...), ALL_OFF, endl ? "\n" : "");
 		fflush(stdout);
 	}
 
 	template <bool endl = true, typename... Args>
 	void log3(const char* fmt, Args&&... args)
 	{
-		zpr::print("{}    +{} {}{}", PINK, ALL_OFF, zpr::fwd(fmt, static_cast<Args&&>(args)...), endl ? "\n" : "");
+		zpr::print("{}{}{}", LOG3_PREFIX, zpr::fwd(fmt, static_cast<Args&&>(args)...), endl ? "\n" : "");
 		fflush(stdout);
 	}
 
 	template <bool endl = true, typename... Args>
 	void warn(const char* fmt, Args&&... args)
 	{
-		zpr::print("{}==> WARNING:{} {}{}{}{}", YELLOW, ALL_OFF, BOLD, zpr::fwd(fmt, static_cast<Args&&>(args)...),
-		    ALL_OFF, endl ? "\n" : "");
+		zpr::print("{}{}{}{}", WARN_PREFIX, zpr::fwd(fmt, static_cast<Args&&>(args)...), ALL_OFF, endl ? "\n" : "");
 		fflush(stdout);
 	}
 
 	template <bool endl = true, typename... Args>
 	Err<int> error(const char* fmt, Args&&... args)
 	{
-		zpr::print("{}==> ERROR:{} {}{}{}{}", RED, ALL_OFF, BOLD, zpr::fwd(fmt, static_cast<Args&&>(args)...), ALL_OFF,
-		    endl ? "\n" : "");
+		zpr::print("{}{}{}{}", ERROR_PREFIX, zpr::fwd(fmt, static_cast<Args&&>(args)...), ALL_OFF, endl ? "\n" : "");
 		fflush(stdout);
 		return Err(0);
 	}
@@ -177,8 +209,6 @@ namespace msg
 
 namespace util
 {
-	std::pair<zprocpipe::Process, int> try_command(const std::string& cmd, const std::vector<std::string>& args);
-
 	struct IPSubnet
 	{
 		uint32_t ip;
@@ -189,6 +219,7 @@ namespace util
 	bool subnet_contains_ip(zst::str_view subnet, zst::str_view ip);
 
 	zst::Result<zst::unique_span<uint8_t[]>, int> read_entire_file(const std::string& path);
+	zst::Result<zst::unique_span<uint8_t[]>, int> read_entire_file(int fd, const std::string& path);
 	zst::Failable<int> write_to_file(int fd, const std::string& contents);
 
 	zst::str_view trim(zst::str_view sv);
@@ -197,6 +228,13 @@ namespace util
 
 	std::string replace_all(std::string str, const std::string& target, std::string replacement);
 
+	// formats onto the end of `out`, without building a temporary string
+	template <typename... Args>
+	void append_fmt(std::string& out, const char* fmt, Args&&... args)
+	{
+		zpr::cprint([&out](const char* s, size_t n) { out.append(s, n); }, fmt, static_cast<Args&&>(args)...);
+	}
+
 	template <typename Fn>
 	struct Defer
 	{
@@ -2,9 +2,11 @@
 // Copyright (c) 2023, zhiayang
 // SPDX-License-Identifier: Apache-2.0
 
+#include <fcntl.h>
 #include <errno.h>
 #include <string.h>
 #include <assert.h>
+#include <unistd.h>
 #include <sys/stat.h>
 #include <sys/types.h>
 
@@ -21,6 +23,15 @@ namespace wg
 
 	Result<zprocpipe::Process, int>
 	run_cmd(const std::string& cmd, const std::vector<std::string>& args, bool quiet, bool change_pgid)
+	{
+		return run_cmd(cmd, args, stdfs::current_path(), quiet, change_pgid);
+	}
+
+	Result<zprocpipe::Process, int> run_cmd(const std::string& cmd,
+	    const std::vector<std::string>& args,
+	    const stdfs::path& cwd,
+	    bool quiet,
+	    bool change_pgid)
 	{
 		if(is_verbose() && not quiet)
 		{
@@ -31,7 +42,7 @@ namespace wg
 			msg::log3("{}", p);
 		}
 
-		auto [maybe_proc, err] = zprocpipe::runProcess(cmd, args, quiet, quiet, change_pgid);
+		auto [maybe_proc, err] = zprocpipe::runProcess(cmd, args, cwd, quiet, quiet, change_pgid);
 		if(not maybe_proc.has_value())
 			return msg::error("Failed to launch {}{}: {}", cmd, args, err);
 
@@ -41,24 +52,72 @@ namespace wg
 		return Ok(std::move(*maybe_proc));
 	}
 
-	zst::Failable<int> set_wireguard_config(const Config& config, const std::string& interface_name)
+	// returns a file with no name in the filesystem, for handing the config to `wg` as /dev/fd/N
+	static int open_anonymous_file(const Config& config)
 	{
-		// set the config
-		auto fifo_path = stdfs::temp_directory_path() / zpr::sprint("tmp-{}.conf", config.name);
+		auto tmp_dir = stdfs::temp_directory_path();
 
+#if defined(O_TMPFILE)
+		// the file is created unnamed, so there is nothing to unlink. not every filesystem
+		// supports this, so fall back to create + unlink if it fails.
+		if(auto fd = open(tmp_dir.c_str(), O_TMPFILE | O_WRONLY, 0600); fd >= 0)
+			return fd;
+#endif
+
+		auto path = tmp_dir / zpr::sprint("tmp-{}.conf", config.name);
+		auto fd = open(path.c_str(), O_WRONLY | O_TRUNC | O_CREAT, 0600);
+
+		// unlink the guy so it doesn't show up in the filesystem
+		if(fd >= 0)
+			unlink(path.c_str());
+
+		return fd;
+	}
+
+	// `wg_subcommand` is either "setconf" (replace everything) or "syncconf" (apply only the differences)
+	static zst::Failable<int>
+	apply_wireguard_config(const Config& config, const std::string& interface_name, const char* wg_subcommand)
+	{
 		auto wg_conf = config.to_wg_conf();
-		auto fifo_fd = open(fifo_path.c_str(), O_WRONLY | O_TRUNC | O_CREAT, 0600);
+		auto fifo_fd = open_anonymous_file(config);
 		if(fifo_fd < 0)
 			return msg::error("Failed to open config fifo: {} ({})", strerror(errno), errno);
 
-		// unlink the guy so it doesn't show up in the filesystem
-		stdfs::remove(fifo_path);
+		auto close_fifo = util::defer([fifo_fd]() { close(fifo_fd); });
 		TRY(util::write_to_file(fifo_fd, wg_conf));
 
 		msg::log("Configuring WireGuard");
-		TRY(run_cmd("wg", { "setconf", interface_name, zpr::sprint("/dev/fd/{}", fifo_fd) }));
-		close(fifo_fd);
+		TRY(run_cmd("wg", { wg_subcommand, interface_name, zpr::sprint("/dev/fd/{}", fifo_fd) }));
+
+		return Ok();
+	}
+
+	zst::Failable<int> set_wireguard_config(const Config& config, const std::string& interface_name)
+	{
+		return apply_wireguard_config(config, interface_name, "setconf");
+	}
+
+	zst::Failable<int> reload(const Config& config)
+	{
+		if(not does_interface_exist(config.name))
+			return wg::up(config);
 
+#if defined(__APPLE__)
+		auto iface = TRY(macos_get_real_interface(config.name));
+#else
+		auto& iface = config.name;
+#endif
+
+		// syncconf updates keys and peers in-place without dropping the link
+		msg::log("Reloading interface {}", config.name);
+		if(apply_wireguard_config(config, iface, "syncconf").is_err())
+		{
+			msg::error("Could not update '{}' in-place", config.name);
+			msg::log2("use `wgman restart {}` to restart the interface instead", config.name);
+			return Err(0);
+		}
+
+		msg::log("Done!");
 		return Ok();
 	}
 
@@ -90,9 +149,9 @@ namespace wg
 		if(fd < 0)
 			return msg::error("Could not create {}: {} ({})", conf_path.string(), strerror(errno), errno);
 
-		// unlink the guy so it doesn't show up in the filesystem
+		// the file is removed by the caller once wg-quick is done with it
+		auto close_file = util::defer([fd]() { close(fd); });
 		TRY(util::write_to_file(fd, wgq_conf));
-		close(fd);
 
 		return Ok(conf_path.string());
 	}
@@ -109,7 +168,8 @@ namespace wg
 
 			auto conf_path = TRY(write_wgquick_conf(config));
 
-			TRY(run_cmd("wg-quick", { "up", conf_path }, /* quiet: */ not is_verbose(), /* change_pgid: */ false));
+			TRY(run_cmd("wg-quick", { "up", conf_path }, config.directory, /* quiet: */ not is_verbose(),
+			    /* change_pgid: */ false));
 			stdfs::remove(conf_path);
 
 #if defined(__APPLE__)
@@ -144,7 +204,8 @@ namespace wg
 
 			auto conf_path = TRY(write_wgquick_conf(config));
 
-			TRY(run_cmd("wg-quick", { "down", conf_path }, /* quiet: */ not is_verbose(), /* change_pgid: */ false));
+			TRY(run_cmd("wg-quick", { "down", conf_path }, config.directory, /* quiet: */ not is_verbose(),
+			    /* change_pgid: */ false));
 			stdfs::remove(conf_path);
 
 			msg::log("Done!");
@@ -12,6 +12,13 @@ namespace wg
 	zst::Result<zprocpipe::Process, int>
 	run_cmd(const std::string& cmd, const std::vector<std::string>& args, bool quiet = false, bool change_pgid = true);
 
+	// same as above, but the command runs with `cwd` as its working directory
+	zst::Result<zprocpipe::Process, int> run_cmd(const std::string& cmd,
+	    const std::vector<std::string>& args,
+	    const std::filesystem::path& cwd,
+	    bool quiet = false,
+	    bool change_pgid = true);
+
 	zst::Failable<int> set_wireguard_config(const Config& config, const std::string& interface_name);
 
 	bool does_interface_exist(const std::string& name);
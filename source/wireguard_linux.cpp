@@ -5,6 +5,7 @@
 #include <errno.h>
 #include <string.h>
 #include <assert.h>
+#include <net/if.h>
 #include <sys/stat.h>
 #include <sys/types.h>
 
@@ -22,8 +23,8 @@ namespace wg
 
 	bool does_interface_exist(const std::string& name)
 	{
-		auto [_, code] = util::try_command("ip", { "link", "show", "dev", name });
-		return code == 0;
+		// ask the kernel directly instead of spawning `ip link show`
+		return if_nametoindex(name.c_str()) != 0;
 	}
 
 	zst::Failable<int> interface_up_impl(const Config& config)
@@ -94,7 +95,7 @@ namespace wg
 		if(config.post_up_cmd.has_value())
 		{
 			auto cmd = util::replace_all(*config.post_up_cmd, "%i", *config.interface);
-			TRY(run_cmd("bash", { "-c", cmd }));
+			TRY(run_cmd("bash", { "-c", cmd }, config.directory));
 		}
 
 		msg::log("Done!");
@@ -129,7 +130,7 @@ namespace wg
 		if(config.post_down_cmd.has_value())
 		{
 			auto cmd = util::replace_all(*config.post_down_cmd, "%i", *config.interface);
-			TRY(run_cmd("bash", { "-c", cmd }));
+			TRY(run_cmd("bash", { "-c", cmd }, config.directory));
 		}
 
 		// note: no need to manually delete routes, deleting the interface does that for us.